@@ -15,7 +15,10 @@ cd $HOME
 echo Updating OS and installing system dependencies...
 sudo apt update
 
-sudo apt install pulsaudio pulseaudio-module-bluetooth mpg123
+sudo apt install pulseaudio pulseaudio-module-bluetooth mpg123
+
+echo Installing Python D-Bus bindings used to detect Bluetooth speakers...
+sudo apt install -y python3-pydbus python3-gi
 
 echo Starting Pulse Audio on boot
 #echo "pulseaudio --start" >> ~/.bashrc
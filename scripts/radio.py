@@ -7,174 +7,391 @@ Plays https://wamu.cdnstream1.com/wamu.mp3 in the background
 
 import os
 import sys
-import subprocess
+import fcntl
+import select
+import shutil
 import time
 import signal
 import logging
+import threading
+import functools
 
-from pathlib import Path
+try:
+    from pydbus import SystemBus
+    from gi.repository import GLib
+except ImportError as e:
+    SystemBus = None
+    DBUS_IMPORT_ERROR = e
 
 # Import our custom logging utilities
-from utils.logger_utils import setup_logging, get_logger
+from utils.logger_utils import setup_logging, stop_logging, DEFAULT_LOG_DIR
 
 # Configuration
 STREAM_URL = "https://wamu.cdnstream1.com/wamu.mp3"
 SCRIPT_NAME = os.path.basename(__file__)
+STDERR_TAIL_BYTES = 4096
+
+# BlueZ D-Bus names
+BLUEZ_SERVICE = 'org.bluez'
+BLUEZ_DEVICE_IFACE = 'org.bluez.Device1'
+BLUETOOTH_RECHECK_SECONDS = 30
+
+# Signals handled by the shutdown thread
+SHUTDOWN_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+# Signals reset to their default action in the player, as Popen's
+# restore_signals would do (Python ignores them in our process)
+PLAYER_DEFAULT_SIGNALS = {signal.SIGPIPE, signal.SIGXFSZ}
 
 # Global variables
 logger = None
-player_process = None
+player_pid = None
+player_exited = threading.Event()
+# Guards player_pid against the signal thread
+player_lock = threading.Lock()
+pid_file_fd = None
+signal_thread = None
+shutting_down = threading.Event()
+
+def get_pid_dir():
+    """Return the directory for the PID file
+
+    Uses the user's runtime directory, falling back to the app's log
+    directory rather than a shared, world-writable one like /tmp.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        if os.path.isdir(runtime_dir):
+            return runtime_dir
+        if logger:
+            logger.warning("Runtime directory %s does not exist, using %s for the PID file", runtime_dir, DEFAULT_LOG_DIR)
+    
+    os.makedirs(DEFAULT_LOG_DIR, exist_ok=True)
+    return DEFAULT_LOG_DIR
 
 def is_already_running(script_name):
-    """Check if another instance of this script is already running"""
+    """Check if another instance of this script is already running
+
+    Takes an exclusive lock on a PID file which is held for the lifetime of
+    the process; if the lock is already held, another instance is running.
+    """
+    global pid_file_fd
     if script_name is None:
         return False
         
     try:
-        # Get current process PID
-        current_pid = os.getpid()
-        
-        # Look for other instances
-        result = subprocess.run(
-            ['pgrep', '-f', script_name],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0:
-            pids = [int(pid.strip()) for pid in result.stdout.strip().split('\n') if pid.strip()]
-            # Filter out current process
-            other_pids = [pid for pid in pids if pid != current_pid]
-            
-            if other_pids:
-                if logger:
-                    logger.info(f"Another instance already running (PID: {other_pids}). Exiting.")
-                return True
-                
-    except Exception as e:
+        pid_file = os.path.join(get_pid_dir(), f"{os.path.splitext(script_name)[0]}.pid")
+        # Don't follow symlinks, since we truncate whatever we open
+        fd = os.open(pid_file, os.O_CREAT | os.O_RDWR | os.O_NOFOLLOW, 0o644)
+    except OSError as e:
         if logger:
-            logger.warning(f"Could not check for running instances: {e}")
+            logger.warning("Could not check for running instances, continuing without a PID lock: %s", e)
         return False
     
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        if logger:
+            logger.info("Another instance already running (PID file: %s). Exiting.", pid_file)
+        return True
+    except OSError as e:
+        os.close(fd)
+        if logger:
+            logger.warning("Could not check for running instances: %s", e)
+        return False
+    
+    # Keep the fd open so the lock is held until we exit
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    pid_file_fd = fd
+    
     return False
 
-def signal_handler(signum, frame):
-    """Handle termination signals gracefully"""
-    global player_process
-    logger.info(f"Received signal {signum}. Shutting down gracefully...")
+def wait_for_signals():
+    """Wait for termination signals and shut down gracefully
+
+    Runs in a dedicated thread so that logging and subprocess handling happen
+    in a normal thread context rather than inside an async signal handler.
+    The player is only signalled from here; wait_for_exit() reaps it.
+    """
+    signum = signal.sigwait(SHUTDOWN_SIGNALS)
+    logger.info("Received signal %s. Shutting down gracefully...", signum)
     
-    if player_process and player_process.poll() is None:
-        logger.info("Terminating audio player...")
-        player_process.terminate()
-        try:
-            player_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            logger.warning("Player didn't terminate gracefully, killing...")
-            player_process.kill()
+    # Once shutting_down is set under the lock, no new player is started
+    with player_lock:
+        shutting_down.set()
+        pid = player_pid
+        if pid is not None:
+            logger.info("Terminating audio player...")
+            os.kill(pid, signal.SIGTERM)
+    
+    if pid is not None and not player_exited.wait(timeout=5):
+        with player_lock:
+            if player_pid == pid:
+                logger.warning("Player didn't terminate gracefully, killing...")
+                os.kill(pid, signal.SIGKILL)
     
     logger.info("WAMU player stopped.")
-    sys.exit(0)
+    # sys.exit() would only end this thread, so flush logs and exit directly
+    stop_logging()
+    os._exit(0)
 
+@functools.lru_cache(maxsize=None)
 def find_audio_player():
-    """Find available audio player and return command"""
+    """Find available audio player and return (name, command)
+
+    The result is cached since the installed players don't change while we run.
+    """
     players = [
         (['mpg123'], 'mpg123'),
         (['ffplay', '-nodisp', '-autoexit'], 'ffplay')
     ]
     
     for cmd_base, name in players:
-        try:
-            # Check if command exists
-            subprocess.run(['which', cmd_base[0]], 
-                         check=True, 
-                         capture_output=True)
-            logger.info(f"Found audio player: {name}")
-            return cmd_base + [STREAM_URL]
-        except subprocess.CalledProcessError:
-            continue
+        # Check if command exists on PATH
+        if shutil.which(cmd_base[0]):
+            return name, tuple(cmd_base + [STREAM_URL])
     
     return None
 
+def spawn_player(player_cmd):
+    """Start the player in its own session and return (pid, stderr fd)
+
+    Uses posix_spawn so that no Python code runs in the child between fork
+    and exec, which isn't safe with threads. The child gets an empty signal
+    mask, since ours blocks the shutdown signals.
+    """
+    stderr_read, stderr_write = os.pipe()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        pid = os.posix_spawnp(
+            player_cmd[0],
+            player_cmd,
+            os.environ,
+            file_actions=[
+                (os.POSIX_SPAWN_DUP2, devnull, 1),
+                (os.POSIX_SPAWN_DUP2, stderr_write, 2)
+            ],
+            setsid=True,  # Create new process group
+            setsigmask=set(),
+            setsigdef=PLAYER_DEFAULT_SIGNALS
+        )
+    except BaseException:
+        os.close(stderr_read)
+        raise
+    finally:
+        os.close(stderr_write)
+        os.close(devnull)
+    
+    return pid, stderr_read
+
+def wait_for_exit(pid):
+    """Block until the player exits, reap it and return its exit code
+
+    Waits on a pidfd where available rather than polling.
+    """
+    global player_pid
+    try:
+        # pidfd becomes readable when the child exits (Linux >= 5.3, Python >= 3.9)
+        pidfd = os.pidfd_open(pid, 0)
+    except (AttributeError, OSError):
+        pidfd = None
+        # Fall back to polling on older kernels/Python, without reaping yet
+        while os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            time.sleep(1)
+    
+    try:
+        if pidfd is not None:
+            select.select([pidfd], [], [])
+        
+        # Reap and clear player_pid together so the signal thread never
+        # signals a pid that has already been reaped (and maybe reused)
+        with player_lock:
+            info = None
+            if pidfd is not None:
+                try:
+                    # Reap straight from the pidfd (Linux >= 5.4)
+                    info = os.waitid(os.P_PIDFD, pidfd, os.WEXITED)
+                except OSError:
+                    # EINVAL on Linux 5.3, which has pidfd_open but not P_PIDFD
+                    pass
+            if info is None:
+                info = os.waitid(os.P_PID, pid, os.WEXITED)
+            player_pid = None
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+    
+    player_exited.set()
+    
+    if info.si_code == os.CLD_EXITED:
+        return info.si_status
+    return -info.si_status
+
+def drain_stderr(fd, tail):
+    """Read the player's stderr until EOF, keeping only the most recent output"""
+    while True:
+        chunk = os.read(fd, STDERR_TAIL_BYTES)
+        if not chunk:
+            break
+        tail.extend(chunk)
+        del tail[:-STDERR_TAIL_BYTES]
+    os.close(fd)
+
 def play_stream():
     """Play the WAMU stream"""
-    global player_process
+    global player_pid
     
     # Find suitable audio player
-    player_cmd = find_audio_player()
-    if not player_cmd:
+    player = find_audio_player()
+    if not player:
         logger.error("No suitable audio player found!")
         logger.error("Please install one of: mpv, mpg123, vlc, mplayer, or ffmpeg")
         return False
     
+    player_name, player_cmd = player
+    logger.info("Found audio player: %s", player_name)
+    
     try:
-        logger.info(f"Starting WAMU stream with command: {' '.join(player_cmd)}")
+        logger.info("Starting WAMU stream with command: %s", ' '.join(player_cmd))
         
-        # Start the player process
-        player_process = subprocess.Popen(
-            player_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            preexec_fn=os.setsid  # Create new process group
+        # Start the player process, unless a shutdown has already begun
+        with player_lock:
+            if not shutting_down.is_set():
+                player_pid, stderr_fd = spawn_player(player_cmd)
+        
+        if shutting_down.is_set() and player_pid is None:
+            # The signal thread will exit the process
+            signal_thread.join()
+        
+        # Drain stderr while the player runs so a full pipe can't stall it
+        stderr_tail = bytearray()
+        stderr_thread = threading.Thread(
+            target=drain_stderr,
+            args=(stderr_fd, stderr_tail),
+            daemon=True
         )
+        stderr_thread.start()
         
-        logger.info(f"WAMU stream started (PID: {player_process.pid})")
+        logger.info("WAMU stream started (PID: %s)", player_pid)
         
         # Wait for the process to complete
-        while player_process.poll() is None:
-            time.sleep(1)
+        returncode = wait_for_exit(player_pid)
+        
+        if shutting_down.is_set():
+            # The signal thread stopped the player and will exit the process
+            signal_thread.join()
         
         # Check exit status
-        if player_process.returncode != 0:
-            stderr_output = player_process.stderr.read().decode('utf-8', errors='ignore')
-            logger.error(f"Player exited with code {player_process.returncode}")
+        if returncode != 0:
+            stderr_thread.join(timeout=1)
+            stderr_output = stderr_tail.decode('utf-8', errors='ignore')
+            logger.error("Player exited with code %s", returncode)
             if stderr_output:
-                logger.error(f"Player error: {stderr_output}")
+                logger.error("Player error: %s", stderr_output)
             return False
         
         logger.info("Player finished normally")
         return True
         
     except Exception as e:
-        logger.error(f"Error starting player: {e}")
+        logger.error("Error starting player: %s", e)
         return False
 
+def get_connected_bluetooth_devices(bus):
+    """Return (path, name) for each connected Bluetooth device known to BlueZ"""
+    manager = bus.get(BLUEZ_SERVICE, '/')
+    devices = []
+    for path, interfaces in manager.GetManagedObjects().items():
+        device = interfaces.get(BLUEZ_DEVICE_IFACE)
+        if device and device.get('Connected'):
+            devices.append((path, device.get('Alias', device.get('Address', path))))
+    return devices
+
+def wait_for_bluetooth_device_dbus():
+    """Block until BlueZ reports a connected device
+
+    Waits on PropertiesChanged signals, re-checking the managed objects
+    every BLUETOOTH_RECHECK_SECONDS in case a signal is missed.
+    """
+    bus = SystemBus()
+    loop = GLib.MainLoop()
+    connected = []  # Object path of the device that connected
+    
+    def on_properties_changed(sender, path, iface, signal_name, params):
+        interface, changed, _ = params
+        if interface == BLUEZ_DEVICE_IFACE and changed.get('Connected'):
+            connected.append(path)
+            loop.quit()
+    
+    def recheck_devices():
+        try:
+            devices = get_connected_bluetooth_devices(bus)
+        except Exception as e:
+            logger.warning("Error re-checking Bluetooth devices: %s", e)
+            return True
+        if devices:
+            connected.append(devices[0][0])
+            loop.quit()
+        return True  # Removed explicitly once the loop exits
+    
+    # Subscribe before the initial check so a connection in between isn't missed
+    subscription = bus.subscribe(
+        sender=BLUEZ_SERVICE,
+        iface='org.freedesktop.DBus.Properties',
+        signal='PropertiesChanged',
+        arg0=BLUEZ_DEVICE_IFACE,
+        signal_fired=on_properties_changed
+    )
+    try:
+        devices = get_connected_bluetooth_devices(bus)
+        if devices:
+            names = '\n'.join(f"{name} ({path})" for path, name in devices)
+            logger.info("Connected Bluetooth devices found:\n%s", names)
+            return
+        
+        logger.info("No Bluetooth devices connected. Waiting for a device to connect...")
+        recheck_source = GLib.timeout_add_seconds(BLUETOOTH_RECHECK_SECONDS, recheck_devices)
+        try:
+            loop.run()
+        finally:
+            GLib.source_remove(recheck_source)
+        
+        # Signals only carry the object path, so look up the name to log
+        path = connected[0]
+        try:
+            names = dict(get_connected_bluetooth_devices(bus))
+        except Exception:
+            names = {}
+        logger.info("Bluetooth device connected: %s (%s)", names.get(path, path), path)
+    finally:
+        subscription.unsubscribe()
+
 def check_bluetooth_devices():
-    """Check for connected Bluetooth devices and wait until one is found"""
+    """Wait until a Bluetooth device is connected; False if D-Bus is unavailable"""
     logger.info("Checking for connected Bluetooth devices...")
     
+    if SystemBus is None:
+        logger.error("Cannot check Bluetooth devices, D-Bus support is missing: %s", DBUS_IMPORT_ERROR)
+        logger.error("Please install python3-pydbus and python3-gi")
+        return False
+    
     while True:
         try:
-            result = subprocess.run(
-                ['bluetoothctl', 'devices', 'Connected'],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            if result.returncode == 0:
-                connected_devices = result.stdout.strip()
-                if connected_devices:
-                    logger.info(f"Connected Bluetooth devices found:\n{connected_devices}")
-                    return  # Exit the loop and continue execution
-                else:
-                    logger.info("No Bluetooth devices connected. Waiting 30 seconds before checking again...")
-                    time.sleep(30)
-            else:
-                logger.warning(f"Failed to check Bluetooth devices (exit code: {result.returncode})")
-                logger.warning(f"Error output: {result.stderr.strip()}")
-                logger.info("Waiting 30 seconds before retrying...")
-                time.sleep(30)
-                
-        except subprocess.TimeoutExpired:
-            logger.warning("Bluetooth device check timed out. Waiting 30 seconds before retrying...")
-            time.sleep(30)
+            wait_for_bluetooth_device_dbus()
+            return True  # Exit the loop and continue execution
         except Exception as e:
-            logger.warning(f"Error checking Bluetooth devices: {e}. Waiting 30 seconds before retrying...")
+            logger.warning("Error checking Bluetooth devices: %s. Waiting 30 seconds before retrying...", e)
             time.sleep(30)
 
 def main():
     """Main function"""
-    global logger
+    global logger, signal_thread
+    
+    # Block termination signals before any thread starts (including the log
+    # listener) so they are only ever delivered to the signal thread
+    signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
     
     # Initialize logging with auto-detection
     logger = setup_logging(
@@ -185,17 +402,18 @@ def main():
 
     logger.info("WAMU Radio Stream Player starting...")
     
-    # Set up signal handlers for graceful shutdown
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
+    # Handle termination signals in a dedicated thread
+    signal_thread = threading.Thread(target=wait_for_signals, daemon=True)
+    signal_thread.start()
     
     # Check if already running
     if is_already_running(SCRIPT_NAME):
-        logger.info(f"!! Another instance already running). Exiting.")
+        logger.info("!! Another instance already running). Exiting.")
         sys.exit(0)
     
     # Check for connected Bluetooth devices
-    check_bluetooth_devices()
+    if not check_bluetooth_devices():
+        sys.exit(1)
 
     # Play the stream
     success = play_stream()
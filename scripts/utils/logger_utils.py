@@ -7,10 +7,13 @@ Automatically detects calling application and configures appropriate logging
 """
 
 import logging
+import logging.handlers
 import sys
 import os
+import queue
+import atexit
+import functools
 from pathlib import Path
-import inspect
 
 # Default log directory
 # DEFAULT_LOG_DIR = "/var/log"
@@ -20,6 +23,13 @@ SCRIPTS_DIR = os.path.dirname(FILE_DIR)
 ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
 DEFAULT_LOG_DIR =  ROOT_DIR + '/logs'
 
+# Log file rotation
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUP_COUNT = 3
+
+# Listeners writing queued records to log files in the background
+_queue_listeners = []
+
 def _get_caller_info():
     """
     Get information about the calling application
@@ -28,19 +38,26 @@ def _get_caller_info():
         tuple: (app_name, caller_file_path)
     """
     # Get the caller's frame (skip this function and setup_logging)
-    frame = inspect.currentframe()
     try:
-        # Go up the call stack to find the actual caller
-        caller_frame = frame.f_back.f_back
-        if caller_frame is None:
-            caller_frame = frame.f_back
-        
-        caller_file = caller_frame.f_globals.get('__file__', 'unknown')
-        app_name = Path(caller_file).stem if caller_file != 'unknown' else 'app'
-        
-        return app_name, caller_file
-    finally:
-        del frame
+        caller_frame = sys._getframe(2)
+    except ValueError:
+        caller_frame = sys._getframe(1)
+    
+    return _caller_from_file(caller_frame.f_globals.get('__file__', 'unknown'))
+
+@functools.lru_cache(maxsize=64)
+def _caller_from_file(caller_file):
+    """
+    Derive the application name from the caller's file path
+    
+    Args:
+        caller_file (str): Value of the caller's __file__ global
+    
+    Returns:
+        tuple: (app_name, caller_file_path)
+    """
+    app_name = Path(caller_file).stem if caller_file != 'unknown' else 'app'
+    return app_name, caller_file
 
 def _get_default_log_file(app_name):
     """
@@ -54,6 +71,59 @@ def _get_default_log_file(app_name):
     """
     return f"{DEFAULT_LOG_DIR}/{app_name}.log"
 
+class _LazyFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that opens its file on first emit and, if that fails,
+    disables itself so the remaining handlers keep working
+    """
+    
+    def __init__(self, filename):
+        super().__init__(filename, maxBytes=LOG_MAX_BYTES,
+                         backupCount=LOG_BACKUP_COUNT, delay=True)
+        self._open_failed = False
+    
+    def emit(self, record):
+        # Mirrors BaseRotatingHandler.emit, but drops the record when the file
+        # can't be opened (older Pythons write to a None stream otherwise)
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.stream is not None and self.shouldRollover(record):
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            if self.stream is None:
+                return
+            logging.StreamHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+    
+    def _open(self):
+        if self._open_failed:
+            return None
+        try:
+            return super()._open()
+        except (PermissionError, OSError) as e:
+            self._open_failed = True
+            sys.stderr.write(f"Disabling file logging, could not open {self.baseFilename}: {e}\n")
+            return None
+
+def _stop_queue_listeners():
+    """Stop background log listeners, flushing any queued records"""
+    while _queue_listeners:
+        _queue_listeners.pop().stop()
+
+atexit.register(_stop_queue_listeners)
+
+def stop_logging():
+    """
+    Flush queued log records and shut down logging
+    
+    Runs automatically at exit; call it directly before leaving via os._exit()
+    """
+    _stop_queue_listeners()
+    logging.shutdown()
+
 def setup_logging(log_file=None, log_level=logging.INFO, app_name=None, 
                  console_output=True, file_output=True, log_format=None):
     """
@@ -95,18 +165,31 @@ def setup_logging(log_file=None, log_level=logging.INFO, app_name=None,
         logger.handlers.clear()
     
     # Set up handlers
+    _stop_queue_listeners()
     handlers = []
+    formatter = logging.Formatter(log_format)
     
     if file_output and log_file:
         final_log_file = _setup_log_file(log_file, app_name, caller_file)
         if final_log_file:
-            file_handler = logging.FileHandler(final_log_file)
-            file_handler.setFormatter(logging.Formatter(log_format))
-            handlers.append(file_handler)
+            # Opened on first record; an unwritable file disables itself then
+            file_handler = _LazyFileHandler(final_log_file)
+            file_handler.setFormatter(formatter)
+            
+            # Write to the file from a background thread so logging calls
+            # only enqueue the record
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(log_queue, file_handler)
+            listener.start()
+            _queue_listeners.append(listener)
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            # Pass the bare message through; file_handler applies log_format
+            queue_handler.setFormatter(logging.Formatter())
+            handlers.append(queue_handler)
     
     if console_output:
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(logging.Formatter(log_format))
+        console_handler.setFormatter(formatter)
         handlers.append(console_handler)
     
     # Configure logging
@@ -143,49 +226,31 @@ def _setup_log_file(log_file, app_name, caller_file):
     
     # Try to create and use the requested log directory
     try:
-        if not log_dir.exists():
-            log_dir.mkdir(parents=True, exist_ok=True)
-        # Test write access
-        test_file = log_dir / f".{app_name}_write_test"
-        test_file.touch()
-        test_file.unlink()
-        return log_file
+        log_dir.mkdir(parents=True, exist_ok=True)
     except (PermissionError, OSError):
         pass
+    if os.access(str(log_dir), os.W_OK):
+        return log_file
     
     # Fallback 1: Try user's home directory
+    home_log_dir = Path.home() / "logs"
     try:
-        home_log_dir = Path.home() / "logs"
         home_log_dir.mkdir(exist_ok=True)
-        home_log_file = home_log_dir / f"{app_name}.log"
-        test_file = home_log_dir / f".{app_name}_write_test"
-        test_file.touch()
-        test_file.unlink()
-        return str(home_log_file)
     except (PermissionError, OSError):
         pass
+    if os.access(str(home_log_dir), os.W_OK):
+        return str(home_log_dir / f"{app_name}.log")
     
     # Fallback 2: Local directory relative to caller
-    try:
-        if caller_file and caller_file != 'unknown':
-            local_dir = Path(caller_file).parent
-            local_log_file = local_dir / f"{app_name}.log"
-            test_file = local_dir / f".{app_name}_write_test"
-            test_file.touch()
-            test_file.unlink()
-            return str(local_log_file)
-    except (PermissionError, OSError):
-        pass
+    if caller_file and caller_file != 'unknown':
+        local_dir = Path(caller_file).parent
+        if os.access(str(local_dir), os.W_OK):
+            return str(local_dir / f"{app_name}.log")
     
     # Fallback 3: Current working directory
-    try:
-        cwd_log_file = Path.cwd() / f"{app_name}.log"
-        test_file = Path.cwd() / f".{app_name}_write_test"
-        test_file.touch()
-        test_file.unlink()
-        return str(cwd_log_file)
-    except (PermissionError, OSError):
-        pass
+    cwd = Path.cwd()
+    if os.access(str(cwd), os.W_OK):
+        return str(cwd / f"{app_name}.log")
     
     # If all else fails, disable file logging
     return None
@@ -235,14 +300,28 @@ def configure_logger(logger_name, log_level=None, console_output=None,
         # For now, recommend calling setup_logging again with new parameters
         logger.warning("To change output destinations, call setup_logging() again")
 
+def logger_exists(name):
+    """
+    Check whether a logger with the given name has been created
+    
+    Args:
+        name (str): Logger name
+    
+    Returns:
+        bool: True if the logger exists
+    """
+    return name in logging.Logger.manager.loggerDict
+
 def list_active_loggers():
     """
     List all currently active logger names
     
+    Copies every registered name; use logger_exists() for single lookups
+    
     Returns:
         list: List of active logger names
     """
-    return [name for name in logging.Logger.manager.loggerDict.keys()]
+    return list(logging.Logger.manager.loggerDict)
 
 # Convenience functions for common log levels
 def setup_debug_logging(**kwargs):